@@ -5,180 +5,372 @@ from __future__ import annotations
 import json
 import os
 import re
+import string
 import sys
-from typing import Dict, List, Set, Tuple
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Set, Tuple
 
-CJK_RE = re.compile(r"[\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF\u3040-\u30FF\uAC00-\uD7AF]")
-BLOCK_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
-IDENTIFIER_RE = re.compile(r"^[A-Z][A-Z0-9_]*$")
+try:  # optional linear-time engine for the comment/string masking pass
+    import re2 as _re2
+except ImportError:  # pragma: no cover - google-re2 is not a required dependency
+    _re2 = None
 
-TABLE_RE = re.compile(
-    r'\bCREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?([`"\[\]\w\.\$#@]+)',
-    flags=re.IGNORECASE,
-)
-VIEW_RE = re.compile(
-    r'\bCREATE\s+(?:OR\s+REPLACE\s+)?VIEW\s+([`"\[\]\w\.\$#@]+)',
-    flags=re.IGNORECASE,
-)
-PROC_RE = re.compile(
-    r'\bCREATE\s+(?:OR\s+REPLACE\s+)?PROCEDURE\s+([`"\[\]\w\.\$#@]+)',
-    flags=re.IGNORECASE,
+try:  # optional compiled JSON encoder for large reports
+    import orjson as _orjson
+except ImportError:  # pragma: no cover - orjson is not a required dependency
+    _orjson = None
+
+# Set SQL_ANALYZER_REGEX_ENGINE=re2 to mask with google-re2 (no backtracking, so
+# unterminated comments/literals cannot cause quadratic scans). The stdlib engine
+# stays the default because it is faster on ordinary scripts.
+USE_RE2 = _re2 is not None and os.environ.get("SQL_ANALYZER_REGEX_ENGINE", "").lower() == "re2"
+
+# The Node backend parses the report, so it is emitted compactly unless
+# SQL_ANALYZER_PRETTY is set (handy when reading the CLI output by hand).
+PRETTY_JSON = bool(os.environ.get("SQL_ANALYZER_PRETTY"))
+
+_INLINE_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"))
+
+
+def _compile_masking(pattern: str, flags: int = 0):
+    """Compile a masking pattern with re2 when enabled, otherwise with re."""
+    if USE_RE2:
+        inline = "".join(letter for flag, letter in _INLINE_FLAGS if flags & flag)
+        return _re2.compile(f"(?{inline}){pattern}" if inline else pattern)
+    return re.compile(pattern, flags)
+
+
+CJK_RE = re.compile(r"[\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF\u3040-\u30FF\uAC00-\uD7AF]")
+BLOCK_COMMENT_RE = _compile_masking(r"/\*.*?\*/", re.DOTALL)
+# Block comments, line comments, single- and double-quoted literals in one alternation
+MASK_RE = _compile_masking(
+    r"/\*.*?\*/"
+    r"|--[^\n]*"
+    r"|'(?:''|[^'])*'"
+    r'|"(?:""|[^"])*"',
+    re.DOTALL,
 )
-FUNC_RE = re.compile(
-    r'\bCREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+([`"\[\]\w\.\$#@]+)',
-    flags=re.IGNORECASE,
+IDENTIFIER_RE = re.compile(r"^[A-Z][A-Z0-9_]*$")
+NEWLINE_RE = re.compile(r"\n")
+
+# Keyword patterns run case-sensitively on the upper-cased SQL (see _upper_keep_offsets).
+# Each starts with its literal keyword so the regex engine can jump between candidates
+# with its literal-prefix search; the leading word boundary is a lookbehind instead of \b.
+# Every CREATE TABLE/VIEW/PROCEDURE/FUNCTION/TRIGGER in one pass; only tables lack
+# OR REPLACE and triggers need no name
+CREATE_OBJECT_RE = re.compile(
+    r"CREATE(?<!\wCREATE)\s+"
+    r"(?:"
+    r"(?:(?P<table>TABLE)\s+(?:IF\s+NOT\s+EXISTS\s+)?|(?:OR\s+REPLACE\s+)?(?P<routine>VIEW|PROCEDURE|FUNCTION)\s+)"
+    r'(?P<name>[`"\[\]\w\.\$#@]+)'
+    r"|(?:OR\s+REPLACE\s+)?(?P<trigger>TRIGGER)\b"
+    r")"
 )
+DELETE_RE = re.compile(r'DELETE(?<!\wDELETE)\s+FROM\s+([`"\[\]\w\.\$#@]+)')
+WHERE_RE = re.compile(r"WHERE(?<!\wWHERE)\b")
+DML_OR_TERMINATOR_RE = re.compile(r"\b(?:INSERT|UPDATE|DELETE)\b|;", re.IGNORECASE)
+CREATE_KEYWORD_RE = re.compile(r"CREATE(?<!\wCREATE)\b")
+SELECT_RE = re.compile(r"\bSELECT\b", re.IGNORECASE)
+TRUNCATE_RE = re.compile(r"\bTRUNCATE\b", re.IGNORECASE)
+FUNCTION_CALL_RE = re.compile(r"\b[A-Z_][A-Z0-9_]*\s*\(", re.IGNORECASE)
+COLUMN_NAME_RE = re.compile(r'[`"\[\]\w#@\$]+')
+LOWERCASE_RE = re.compile(r"[a-z]")
+FIRST_WORD_RE = re.compile(r"\S+")
+# Paren/comma scans jump straight to the characters that change the state
+PAREN_RE = re.compile(r"[()]")
+PAREN_OR_COMMA_RE = re.compile(r"[(),]")
+# '=' missing a space on its left / right side (comparison operators excluded)
+EQ_NO_SPACE_LEFT_RE = re.compile(r"(?<![\s<>=!])=(?!=)")
+EQ_NO_SPACE_RIGHT_RE = re.compile(r"=(?!=)(?![\s=])")
+
+# object kind -> (label, required prefix, rule id)
+OBJECT_PREFIX_RULES: Dict[str, Tuple[str, str, str]] = {
+    "TABLE": ("表名", "T_", "RULE_04_PREFIX_TABLE"),
+    "VIEW": ("视图名", "V_", "RULE_04_PREFIX_VIEW"),
+    "PROCEDURE": ("存储过程名", "P_", "RULE_04_PREFIX_PROC"),
+    "FUNCTION": ("函数名", "F_", "RULE_04_PREFIX_FUNC"),
+}
+
+ASCII_UPPER = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+
+# Cap for evidence copied from statement text (see _cap_evidence); line snippets
+# passed as evidence keep _line_snippet's own 240-char cap
+EVIDENCE_MAX_LEN = 120
+
+
+class RawIssue(NamedTuple):
+    """Fixed-shape issue record; expanded into report dicts by _aggregate_issues."""
+
+    rule_id: str
+    message: str
+    pos_idx: int
+    evidence: str
+    severity: str
+    obj_name: str
+    recommendation: str
 
 
 # ---------- position helpers ----------
-def _idx_to_linecol(sql: str, idx: int) -> Tuple[int, int]:
+@dataclass
+class _SqlSource:
+    """Per-call views of the SQL text shared by every rule check."""
+
+    sql: str
+    upper: str
+    line_starts: List[int]
+    # Comments and literals blanked out, in original case and upper-cased
+    masked: str
+    masked_upper: str
+    # (kind, match) for every CREATE_OBJECT_RE hit, in document order
+    creates: List[Tuple[str, re.Match]]
+    # Start of every CREATE keyword; statements run from one to the next
+    create_offsets: List[int]
+
+
+def _build_line_index(sql: str) -> List[int]:
+    """Offsets where each line starts; line N starts at line_starts[N - 1]."""
+    line_starts = [0]
+    line_starts.extend(match.end() for match in NEWLINE_RE.finditer(sql))
+    return line_starts
+
+
+def _idx_to_linecol(line_starts: List[int], idx: int) -> Tuple[int, int]:
     """0-based idx -> (1-based line, 1-based column)."""
-    line = sql.count("\n", 0, idx) + 1
-    last_nl = sql.rfind("\n", 0, idx)
-    col = idx - (last_nl + 1) + 1
+    line = bisect_right(line_starts, idx)
+    col = idx - line_starts[line - 1] + 1
     return line, col
 
 
-def _line_snippet(sql: str, idx: int, max_len: int = 240) -> str:
+def _line_span(line_starts: List[int], start_idx: int, end_idx: int) -> int:
+    """Number of lines touched by sql[start_idx:end_idx] (newlines inside it + 1)."""
+    return bisect_right(line_starts, end_idx) - bisect_right(line_starts, start_idx) + 1
+
+
+def _line_snippet(sql: str, line_starts: List[int], idx: int, max_len: int = 240) -> str:
     """Extract the full line containing idx (trim to max_len)."""
-    start = sql.rfind("\n", 0, idx) + 1
-    end = sql.find("\n", idx)
-    if end == -1:
-        end = len(sql)
+    line = bisect_right(line_starts, idx)
+    start = line_starts[line - 1]
+    end = line_starts[line] - 1 if line < len(line_starts) else len(sql)
+    if end - start > max_len and sql[end - 1] != "\r":
+        # Long line: slice only the kept prefix instead of materialising the whole line
+        return sql[start : start + max_len] + "..."
     snippet = sql[start:end].rstrip("\r")
     if len(snippet) > max_len:
         snippet = snippet[:max_len] + "..."
     return snippet
 
 
+def _upper_keep_offsets(sql: str) -> str:
+    """Upper-case sql so that every index still maps 1:1 onto the original text.
+
+    str.upper() expands a few non-ASCII characters (e.g. "ß" -> "SS"); in that case
+    only ASCII letters are folded, which is all the keyword patterns need.
+    """
+    upper = sql.upper()
+    if len(upper) == len(sql):
+        return upper
+    return sql.translate(ASCII_UPPER)
+
+
 # ---------- masking comments & strings (keeps positions) ----------
-def _mask_span_with_spaces(text: str, start: int, end: int) -> str:
-    return text[:start] + "".join("\n" if ch == "\n" else " " for ch in text[start:end]) + text[end:]
+def _blank_out(text: str) -> str:
+    """Spaces for every character of text except newlines, built per line in C."""
+    return "\n".join(" " * len(part) for part in text.split("\n"))
+
+
+def _mask_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    """Blank the given (start, end) spans of text, keeping newlines & length."""
+    if not spans:
+        return text
+    parts: List[str] = []
+    last = 0
+    for start, end in spans:
+        parts.append(text[last:start])
+        # -- comments and most literals fit on one line: no need to slice the span
+        if text.find("\n", start, end) == -1:
+            parts.append(" " * (end - start))
+        else:
+            parts.append(_blank_out(text[start:end]))
+        last = end
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def _mask_matches(pattern: re.Pattern, sql: str) -> str:
+    """Blank every match of pattern in a single pass, keeping newlines & length."""
+    return _mask_spans(sql, [match.span() for match in pattern.finditer(sql)])
 
 
 def _mask_block_comments(sql: str) -> str:
     """Replace /* ... */ comment bodies with spaces while keeping length consistent."""
-    masked = sql
-    for match in BLOCK_COMMENT_RE.finditer(sql):
-        masked = _mask_span_with_spaces(masked, match.start(), match.end())
-    return masked
+    if "/*" not in sql:
+        return sql
+    return _mask_matches(BLOCK_COMMENT_RE, sql)
+
+
+def _has_mask_delimiters(sql: str) -> bool:
+    """Whether sql contains anything MASK_RE could match (quotes or comment openers)."""
+    return "'" in sql or '"' in sql or "--" in sql or "/*" in sql
 
 
 def _mask_comments_and_strings(sql: str) -> str:
     """Replace comment/string contents with spaces but keep newlines & length."""
-    masked = _mask_block_comments(sql)
+    if not _has_mask_delimiters(sql):
+        return sql
+    return _mask_matches(MASK_RE, sql)
 
-    for match in re.finditer(r"--.*?$", masked, flags=re.MULTILINE):
-        masked = _mask_span_with_spaces(masked, match.start(), match.end())
 
-    for match in re.finditer(r"'(?:''|[^'])*'", masked, flags=re.DOTALL):
-        masked = _mask_span_with_spaces(masked, match.start(), match.end())
+def _build_source(sql: str) -> _SqlSource:
+    upper = _upper_keep_offsets(sql)
+    if not _has_mask_delimiters(sql):
+        masked, masked_upper = sql, upper
+    else:
+        # Delimiters are ASCII punctuation, so one scan yields the spans for both cases
+        spans = [match.span() for match in MASK_RE.finditer(sql)]
+        masked = _mask_spans(sql, spans)
+        masked_upper = _mask_spans(upper, spans)
+    creates: List[Tuple[str, re.Match]] = []
+    create_offsets: List[int] = []
+    # Prefilter on the mask: a CREATE that only appears in comments/literals needs no scan
+    if "CREATE" in masked_upper:
+        for match in CREATE_OBJECT_RE.finditer(masked_upper):
+            kind = match.group("table") or match.group("routine") or match.group("trigger")
+            creates.append((kind, match))
+    # Statement boundaries are only needed once there is an object to check
+    if creates:
+        create_offsets = [match.start() for match in CREATE_KEYWORD_RE.finditer(masked_upper)]
+    return _SqlSource(
+        sql=sql,
+        upper=upper,
+        line_starts=_build_line_index(sql),
+        masked=masked,
+        masked_upper=masked_upper,
+        creates=creates,
+        create_offsets=create_offsets,
+    )
 
-    for match in re.finditer(r'"(?:""|[^"])*"', masked, flags=re.DOTALL):
-        masked = _mask_span_with_spaces(masked, match.start(), match.end())
 
-    return masked
+def _iter_creates(source: _SqlSource, kind: str) -> Iterator[re.Match]:
+    """CREATE_OBJECT_RE matches of one object kind, in document order."""
+    for match_kind, match in source.creates:
+        if match_kind == kind:
+            yield match
 
 
 # ---------- token helpers ----------
+def _original_text(sql: str, match: re.Match, group: int | str = 0) -> str:
+    """Original-case text of a match found on the upper-cased copy of sql."""
+    return sql[match.start(group) : match.end(group)]
+
+
 def _last_identifier(name_token: str) -> str:
     token = name_token.strip()
+    # Fast path: plain unqualified, unquoted identifiers need no further work
+    if not token or not (token[0] in '`"[' or token[-1] in '`"]' or "." in token):
+        return token
     if "." in token:
-        token = token.split(".")[-1]
+        token = token.rpartition(".")[2]
     if token.startswith("[") and token.endswith("]"):
         token = token[1:-1]
     token = token.strip('`"')
     return token
 
 
-def _find_next_create(masked_sql: str, start_idx: int) -> int:
-    match = re.search(r"\bCREATE\b", masked_sql[start_idx + 1 :], flags=re.IGNORECASE)
-    if match is None:
-        return len(masked_sql)
-    return start_idx + 1 + match.start()
+def _find_next_create(source: _SqlSource, start_idx: int) -> int:
+    """Offset of the first CREATE keyword after start_idx, or the end of the SQL."""
+    offsets = source.create_offsets
+    pos = bisect_right(offsets, start_idx)
+    if pos == len(offsets):
+        return len(source.sql)
+    return offsets[pos]
 
 
-def _extract_statement(sql: str, masked_sql: str, start_idx: int) -> str:
-    end_idx = _find_next_create(masked_sql, start_idx)
-    return sql[start_idx:end_idx]
+def _statement_spans(masked_sql: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of each ';'-separated chunk, end excluding the ';'."""
+    start = 0
+    while True:
+        end = masked_sql.find(";", start)
+        if end == -1:
+            yield start, len(masked_sql)
+            return
+        yield start, end
+        start = end + 1
 
 
 def _find_matching_paren(masked_sql: str, start_idx: int) -> int:
     depth = 0
-    for idx in range(start_idx, len(masked_sql)):
-        ch = masked_sql[idx]
-        if ch == "(":
+    for match in PAREN_RE.finditer(masked_sql, start_idx):
+        if match.group() == "(":
             depth += 1
-        elif ch == ")":
+        else:
             depth -= 1
             if depth == 0:
-                return idx
+                return match.start()
     return -1
 
 
-def _split_columns(sql: str, masked_sql: str, start_idx: int, end_idx: int) -> List[Tuple[str, int]]:
-    segments: List[Tuple[str, int]] = []
+def _split_columns(masked_sql: str, start_idx: int, end_idx: int) -> List[Tuple[int, int]]:
+    """(start, end) of each top-level comma-separated segment in [start_idx, end_idx)."""
+    segments: List[Tuple[int, int]] = []
     depth = 0
     segment_start = start_idx
-    for idx in range(start_idx, end_idx):
-        ch = masked_sql[idx]
+    for match in PAREN_OR_COMMA_RE.finditer(masked_sql, start_idx, end_idx):
+        ch = match.group()
         if ch == "(":
             depth += 1
         elif ch == ")":
             if depth > 0:
                 depth -= 1
-        elif ch == "," and depth == 0:
-            segment = sql[segment_start:idx]
-            segments.append((segment, segment_start))
+        elif depth == 0:
+            idx = match.start()
+            segments.append((segment_start, idx))
             segment_start = idx + 1
     if segment_start < end_idx:
-        segments.append((sql[segment_start:end_idx], segment_start))
+        segments.append((segment_start, end_idx))
     return segments
 
 
-def _find_statement_terminator(masked_sql: str, start_idx: int) -> int:
-    for idx in range(start_idx, len(masked_sql)):
-        if masked_sql[idx] == ";":
-            return idx + 1
-    return len(masked_sql)
-
+def _iter_dml_segments(masked: str, stmt_start: int, stmt_end: int) -> List[Tuple[int, int]]:
+    """(start, end) of each INSERT/UPDATE/DELETE in masked[stmt_start:stmt_end], ending after the next ';'.
 
-def _iter_dml_segments(statement: str) -> List[Tuple[int, int]]:
-    masked = _mask_comments_and_strings(statement)
+    Keywords and terminators are collected in one scan; every pending DML start is
+    closed by the first ';' that follows it. Offsets are absolute.
+    """
     segments: List[Tuple[int, int]] = []
-    for match in re.finditer(r"\b(INSERT|UPDATE|DELETE)\b", masked, flags=re.IGNORECASE):
-        start = match.start()
-        end = _find_statement_terminator(masked, start)
-        segments.append((start, end))
+    pending: List[int] = []
+    for match in DML_OR_TERMINATOR_RE.finditer(masked, stmt_start, stmt_end):
+        if match.group(0) == ";":
+            segments.extend((start, match.end()) for start in pending)
+            pending.clear()
+        else:
+            pending.append(match.start())
+    segments.extend((start, stmt_end) for start in pending)
     return segments
 
 
-def _has_adjacent_comment(statement: str, start_idx: int, end_idx: int) -> bool:
-    segment = statement[start_idx:end_idx]
-    if re.search(r"--|/\*", segment):
+def _has_adjacent_comment(sql: str, stmt_start: int, stmt_end: int, start_idx: int, end_idx: int) -> bool:
+    """Whether sql[start_idx:end_idx] contains or touches a comment within its statement."""
+    if sql.find("--", start_idx, end_idx) != -1 or sql.find("/*", start_idx, end_idx) != -1:
         return True
 
-    prefix = statement[:start_idx]
-    stripped_prefix = prefix.rstrip()
+    stripped_prefix = sql[stmt_start:start_idx].rstrip()
     if stripped_prefix:
         last_line_start = stripped_prefix.rfind("\n") + 1
-        last_line = stripped_prefix[last_line_start:]
-        if "--" in last_line:
+        if stripped_prefix.find("--", last_line_start) != -1:
             return True
-        if re.search(r"/\*.*\*/\s*$", stripped_prefix, flags=re.DOTALL):
+        # A /* ... */ block closing right before the statement
+        if stripped_prefix.endswith("*/") and stripped_prefix.find("/*", 0, len(stripped_prefix) - 2) != -1:
             return True
 
-    suffix = statement[end_idx:]
-    if re.match(r"\s*(--|/\*)", suffix):
-        return True
-
-    return False
+    return sql[end_idx:stmt_end].lstrip().startswith(("--", "/*"))
 
 
 def _enforce_identifier_format(
-    issues: List[Dict],
+    issues: List[RawIssue],
     name: str,
-    sql: str,
     idx: int,
     obj_desc: str,
 ) -> None:
@@ -191,7 +383,6 @@ def _enforce_identifier_format(
             issues,
             "RULE_01_IDENTIFIER_FORMAT",
             f"{obj_desc} {clean} 不符合命名规范（需使用大写英文、数字、下划线且以字母开头）。",
-            sql,
             idx,
             evidence=clean,
             obj_name=clean,
@@ -203,175 +394,161 @@ def _enforce_identifier_format(
             issues,
             "RULE_03_IDENTIFIER_WORD_LIMIT",
             f"{obj_desc} {clean} 超过 3 个单词（以下划线分隔）。",
-            sql,
             idx,
             evidence=clean,
             obj_name=clean,
         )
 
 
+def _cap_evidence(text: str) -> str:
+    """Trim statement-derived evidence to EVIDENCE_MAX_LEN, marking the cut like snippets."""
+    if len(text) > EVIDENCE_MAX_LEN:
+        return text[:EVIDENCE_MAX_LEN] + "..."
+    return text
+
+
+def _evidence_slice(sql: str, start_idx: int, end_idx: int) -> str:
+    """_cap_evidence(sql[start_idx:end_idx].rstrip()) without copying past the cap."""
+    cut = start_idx + EVIDENCE_MAX_LEN
+    # The stripped text only exceeds the cap if something other than whitespace follows it
+    if cut < end_idx and FIRST_WORD_RE.search(sql, cut, end_idx) is not None:
+        return sql[start_idx:cut] + "..."
+    return sql[start_idx : min(cut, end_idx)].rstrip()
+
+
 def _add_issue(
-    issues: List[Dict],
+    issues: List[RawIssue],
     rule_id: str,
     message: str,
-    sql: str,
     pos_idx: int,
     evidence: str = "",
     severity: str = "ERROR",
     obj_name: str = "",
     recommendation: str = "",
 ) -> None:
-    line, col = _idx_to_linecol(sql, pos_idx)
-    snippet = _line_snippet(sql, pos_idx)
-    resolved_evidence = evidence or snippet
-
-    # Ensure issues affecting the same line are aggregated so arrays remain aligned
-    existing = None
-    for entry in issues:
-        if entry.get("line") == line:
-            existing = entry
-            break
-
-    if existing is None:
-        existing = {
-            "rule_id": rule_id,
-            "rule_ids": [rule_id],
-            "severity": severity,
-            "severity_levels": [severity],
-            "message": message,
-            "issues": [message],
-            "object": obj_name,
-            "line": line,
-            "column": [col],
-            "snippet": snippet,
-            "evidence": resolved_evidence,
-            "evidence_list": [resolved_evidence],
-            "recommendation": [recommendation or ""],
-            "fixed_code": "",
-        }
-        issues.append(existing)
-        return
-
-    existing.setdefault("rule_ids", []).append(rule_id)
-    existing.setdefault("severity_levels", []).append(severity)
-    columns = existing.setdefault("column", [])
-    columns.append(col)
-    entries = existing.setdefault("issues", [])
-    entries.append(message)
-    existing.setdefault("recommendation", []).append(recommendation or "")
-    evidence_list = existing.setdefault("evidence_list", [])
-    evidence_list.append(resolved_evidence)
+    """Record an issue; line/column resolution happens once in _aggregate_issues."""
+    issues.append(RawIssue(rule_id, message, pos_idx, evidence, severity, obj_name, recommendation))
+
+
+def _aggregate_issues(source: _SqlSource, raw_issues: List[RawIssue]) -> List[Dict]:
+    """Resolve positions and merge issues on the same line so arrays remain aligned."""
+    sql = source.sql
+    line_starts = source.line_starts
+    by_line: Dict[int, Dict] = {}
+    for rule_id, message, pos_idx, evidence, severity, obj_name, recommendation in raw_issues:
+        line, col = _idx_to_linecol(line_starts, pos_idx)
+        existing = by_line.get(line)
+        if existing is None:
+            snippet = _line_snippet(sql, line_starts, pos_idx)
+            resolved_evidence = evidence or snippet
+            # The single-value fields are legacy fallbacks holding the line's first issue
+            by_line[line] = {
+                "rule_id": rule_id,
+                "rule_ids": [rule_id],
+                "severity": severity,
+                "severity_levels": [severity],
+                "message": message,
+                "issues": [message],
+                "object": obj_name,
+                "line": line,
+                "column": [col],
+                "snippet": snippet,
+                "evidence": resolved_evidence,
+                "evidence_list": [resolved_evidence],
+                "recommendation": [recommendation or ""],
+                "fixed_code": "",
+            }
+            continue
 
-    # Keep single-value fallbacks in sync for legacy consumers
-    existing["rule_id"] = existing["rule_ids"][0]
-    existing["severity"] = existing["severity_levels"][0]
-    existing["message"] = existing["issues"][0]
-    existing["evidence"] = existing["evidence_list"][0]
+        # The entry already carries its line snippet; only build one for missing evidence
+        resolved_evidence = evidence or _line_snippet(sql, line_starts, pos_idx)
+        existing["rule_ids"].append(rule_id)
+        existing["severity_levels"].append(severity)
+        existing["column"].append(col)
+        existing["issues"].append(message)
+        existing["recommendation"].append(recommendation or "")
+        existing["evidence_list"].append(resolved_evidence)
+    return list(by_line.values())
 
 
 # ---------- rule checks ----------
-def _check_cjk(sql: str, issues: List[Dict]) -> None:
+def _check_cjk(source: _SqlSource, issues: List[RawIssue]) -> None:
     """Rule 1: object names must avoid non-ASCII characters."""
-    masked = _mask_comments_and_strings(sql)
-    match = CJK_RE.search(masked)
+    sql = source.sql
+    if sql.isascii():
+        return
+    # Masking only blanks characters out, so nothing in the mask precedes the first raw hit
+    candidate = CJK_RE.search(sql)
+    # An ASCII mask means every CJK character sits in a comment or literal
+    if candidate is None or source.masked.isascii():
+        return
+    match = CJK_RE.search(source.masked, candidate.start())
     if match:
         ch = match.group(0)
         _add_issue(
             issues,
             "RULE_01_CJK_NAME",
             "检测到中文/非 ASCII 字符（疑似用于对象/列命名），应使用英文单词/短语/缩写。",
-            sql,
             match.start(),
             evidence=f"...{ch}...",
         )
 
 
-def _check_naming_prefixes(sql: str, issues: List[Dict]) -> None:
+def _check_naming_prefixes(source: _SqlSource, issues: List[RawIssue]) -> None:
     """Rule 4 & Rule 14: enforce object prefixes and block TMP_TMP_TMP tables."""
-    masked = _mask_comments_and_strings(sql)
-
-    for match in TABLE_RE.finditer(masked):
-        raw = match.group(1)
-        name = _last_identifier(raw)
-        _enforce_identifier_format(issues, name, sql, match.start(1), "表名")
-        if not name.upper().startswith("T_"):
+    sql = source.sql
+    for kind, match in source.creates:
+        if kind == "TRIGGER":
+            continue
+        label, prefix, rule_id = OBJECT_PREFIX_RULES[kind]
+        name = _last_identifier(_original_text(sql, match, "name"))
+        _enforce_identifier_format(issues, name, match.start("name"), label)
+        # Only the leading characters matter; upper-casing maps each char to 1+ chars,
+        # so the slice's upper form is a prefix of the full name's
+        if not name[: len(prefix)].upper().startswith(prefix):
             _add_issue(
                 issues,
-                "RULE_04_PREFIX_TABLE",
-                f"表名需以 T_ 开头：发现 {name}",
-                sql,
+                rule_id,
+                f"{label}需以 {prefix} 开头：发现 {name}",
                 match.start(),
-                evidence=match.group(0),
                 obj_name=name,
             )
-        if name.upper().startswith("TMP_TMP_TMP"):
+        if kind == "TABLE" and name[:11].upper().startswith("TMP_TMP_TMP"):
             _add_issue(
                 issues,
                 "RULE_14_TMP_TRIPLE",
                 f"中间表命名不得使用 TMP_TMP_TMP 前缀：发现 {name}",
-                sql,
-                match.start(),
-                evidence=match.group(0),
-                obj_name=name,
-            )
-
-    for match in VIEW_RE.finditer(masked):
-        name = _last_identifier(match.group(1))
-        _enforce_identifier_format(issues, name, sql, match.start(1), "视图名")
-        if not name.upper().startswith("V_"):
-            _add_issue(
-                issues,
-                "RULE_04_PREFIX_VIEW",
-                f"视图名需以 V_ 开头：发现 {name}",
-                sql,
-                match.start(),
-                evidence=match.group(0),
-                obj_name=name,
-            )
-
-    for match in PROC_RE.finditer(masked):
-        name = _last_identifier(match.group(1))
-        _enforce_identifier_format(issues, name, sql, match.start(1), "存储过程名")
-        if not name.upper().startswith("P_"):
-            _add_issue(
-                issues,
-                "RULE_04_PREFIX_PROC",
-                f"存储过程名需以 P_ 开头：发现 {name}",
-                sql,
-                match.start(),
-                evidence=match.group(0),
-                obj_name=name,
-            )
-
-    for match in FUNC_RE.finditer(masked):
-        name = _last_identifier(match.group(1))
-        _enforce_identifier_format(issues, name, sql, match.start(1), "函数名")
-        if not name.upper().startswith("F_"):
-            _add_issue(
-                issues,
-                "RULE_04_PREFIX_FUNC",
-                f"函数名需以 F_ 开头：发现 {name}",
-                sql,
                 match.start(),
-                evidence=match.group(0),
                 obj_name=name,
             )
 
 
-def _check_table_definitions(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
+def _check_table_definitions(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    upper = source.upper
+    masked = source.masked_upper
 
-    for match in TABLE_RE.finditer(masked):
-        table_name = _last_identifier(match.group(1))
-        statement = _extract_statement(sql, masked, match.start())
-        statement_upper = statement.upper()
-        if "COMMENT" not in statement_upper:
-            evidence_line = statement.strip().splitlines()[0] if statement.strip() else table_name
+    for match in _iter_creates(source, "TABLE"):
+        table_name = _last_identifier(_original_text(sql, match, "name"))
+        stmt_start = match.start()
+        stmt_end = _find_next_create(source, stmt_start)
+        # Keyword probes read the shared upper-cased copy; the statement text is only
+        # materialised for evidence
+        if upper.find("COMMENT", stmt_start, stmt_end) == -1:
+            # First line of the stripped statement, read from a window just past the cap;
+            # statements start at CREATE, so there is no leading whitespace to skip
+            window = sql[stmt_start : min(stmt_end, stmt_start + EVIDENCE_MAX_LEN + 1)]
+            first_line = window.splitlines()[0] if window else ""
+            if FIRST_WORD_RE.search(sql, stmt_start + len(first_line), stmt_end) is None:
+                # Nothing follows the first line, so stripping also trims its end
+                evidence_line = _evidence_slice(sql, stmt_start, stmt_end)
+            else:
+                evidence_line = _cap_evidence(first_line)
+            evidence_line = evidence_line or table_name
             _add_issue(
                 issues,
                 "RULE_05_TABLE_COMMENT",
                 f"表 {table_name} 缺少注释（COMMENT）。",
-                sql,
                 match.start(),
                 evidence=evidence_line,
                 obj_name=table_name,
@@ -386,36 +563,33 @@ def _check_table_definitions(sql: str, issues: List[Dict]) -> None:
             continue
 
         has_dt_date = False
-        column_segments = _split_columns(sql, masked, paren_start + 1, paren_end)
-        for segment, seg_start in column_segments:
-            raw_segment = segment.strip()
-            if not raw_segment:
+        # Segments are walked by offset; the text is only sliced for names and evidence
+        for seg_start, seg_end in _split_columns(masked, paren_start + 1, paren_end):
+            first_word = FIRST_WORD_RE.search(sql, seg_start, seg_end)
+            if first_word is None:
                 continue
-            keyword = raw_segment.split(None, 1)[0].upper()
+            keyword = first_word.group(0).upper()
             if keyword in {"CONSTRAINT", "PRIMARY", "FOREIGN", "UNIQUE", "CHECK", "KEY"}:
                 continue
 
-            leading = len(segment) - len(segment.lstrip())
-            trimmed = segment.lstrip()
-            name_match = re.match(r'[`"\[\]\w#@\$]+', trimmed)
+            name_match = COLUMN_NAME_RE.match(sql, first_word.start(), seg_end)
             if not name_match:
                 continue
             raw_name = name_match.group(0)
             column_name = _last_identifier(raw_name)
-            name_idx = seg_start + leading + name_match.start()
-            _enforce_identifier_format(issues, column_name, sql, name_idx, f"表 {table_name} 的字段")
+            name_idx = name_match.start()
+            _enforce_identifier_format(issues, column_name, name_idx, f"表 {table_name} 的字段")
 
             if column_name.upper() == "DT_DATE":
                 has_dt_date = True
 
-            if "COMMENT" not in raw_segment.upper():
+            if upper.find("COMMENT", seg_start, seg_end) == -1:
                 _add_issue(
                     issues,
                     "RULE_05_COLUMN_COMMENT",
                     f"表 {table_name} 字段 {column_name} 缺少注释。",
-                    sql,
                     name_idx,
-                    evidence=raw_segment.strip(),
+                    evidence=_evidence_slice(sql, first_word.start(), seg_end),
                     obj_name=f"{table_name}.{column_name}",
                 )
 
@@ -424,113 +598,120 @@ def _check_table_definitions(sql: str, issues: List[Dict]) -> None:
                 issues,
                 "RULE_15_HISTORY_DT_DATE",
                 f"历史表 {table_name} 需包含字段 DT_DATE。",
-                sql,
-                match.start(1),
+                match.start("name"),
                 evidence=table_name,
                 obj_name=table_name,
             )
 
 
-def _check_delete_full_table(sql: str, issues: List[Dict]) -> None:
+def _check_delete_full_table(source: _SqlSource, issues: List[RawIssue]) -> None:
     """Rule 16: DELETE without WHERE must be replaced by TRUNCATE."""
-    masked = _mask_block_comments(sql)
+    if "DELETE" not in source.upper:
+        return
+    sql = source.sql
+    masked = _mask_block_comments(source.upper)
 
-    delete_re = re.finditer(
-        r'\bDELETE\s+FROM\s+([`"\[\]\w\.\$#@]+)([^;]*)',
-        masked,
-        flags=re.IGNORECASE | re.DOTALL,
-    )
-    for match in delete_re:
-        tail = match.group(2) or ""
-        if re.search(r"\bWHERE\b", tail, flags=re.IGNORECASE) is None:
-            table_name = _last_identifier(match.group(1))
+    for stmt_start, stmt_end in _statement_spans(masked):
+        if masked.find("DELETE", stmt_start, stmt_end) == -1:
+            continue
+        # Only the first DELETE of a statement is checked; its tail runs to the ';'
+        match = DELETE_RE.search(masked, stmt_start, stmt_end)
+        if match is None:
+            continue
+        tail_start = match.end()
+        # Cheap substring test first; the regex only confirms the word boundary
+        if (
+            masked.find("WHERE", tail_start, stmt_end) == -1
+            or WHERE_RE.search(masked, tail_start, stmt_end) is None
+        ):
+            table_name = _last_identifier(_original_text(sql, match, 1))
             _add_issue(
                 issues,
                 "RULE_16_DELETE_NO_WHERE",
                 f"检测到对表 {table_name} 的全表删除（DELETE 无 WHERE）。请使用 TRUNCATE。",
-                sql,
                 match.start(),
-                evidence=match.group(0),
+                # Slice one char past the cap so _cap_evidence still marks the cut
+                evidence=_cap_evidence(sql[match.start() : min(stmt_end, match.start() + EVIDENCE_MAX_LEN + 1)]),
                 obj_name=table_name,
             )
 
 
-def _check_uppercase(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
-    match = re.search(r"[a-z]", masked)
+def _check_uppercase(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    # Upper-casing folds every a-z, so an unchanged mask cannot contain one
+    if source.masked == source.masked_upper:
+        return
+    match = LOWERCASE_RE.search(source.masked)
     if match:
         _add_issue(
             issues,
             "RULE_06_UPPERCASE",
             "脚本需使用大写字母，检测到小写字符。",
-            sql,
             match.start(),
-            evidence=_line_snippet(sql, match.start()),
+            evidence=_line_snippet(sql, source.line_starts, match.start()),
             severity="WARNING",
         )
 
 
-def _max_function_call_depth(masked_sql: str) -> int:
+def _max_function_call_depth(masked_sql: str, start_idx: int, end_idx: int) -> int:
     positions: Set[int] = set()
-    for match in re.finditer(r"\b[A-Z_][A-Z0-9_]*\s*\(", masked_sql, flags=re.IGNORECASE):
+    for match in FUNCTION_CALL_RE.finditer(masked_sql, start_idx, end_idx):
         positions.add(match.end() - 1)
 
     stack: List[bool] = []
     current_depth = 0
     max_depth = 0
 
-    for idx, ch in enumerate(masked_sql):
-        if ch == "(":
-            is_func = idx in positions
+    for match in PAREN_RE.finditer(masked_sql, start_idx, end_idx):
+        if match.group() == "(":
+            is_func = match.start() in positions
             stack.append(is_func)
             if is_func:
                 current_depth += 1
                 if current_depth > max_depth:
                     max_depth = current_depth
-        elif ch == ")":
-            if stack:
-                is_func = stack.pop()
-                if is_func and current_depth > 0:
-                    current_depth -= 1
+        elif stack:
+            is_func = stack.pop()
+            if is_func and current_depth > 0:
+                current_depth -= 1
     return max_depth
 
 
-def _check_view_nesting(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
-    for match in VIEW_RE.finditer(masked):
-        view_name = _last_identifier(match.group(1))
-        statement = _extract_statement(sql, masked, match.start())
-        upper_stmt = statement.upper()
-        body_start = upper_stmt.find(" AS ")
-        body = statement[body_start + 4 :] if body_start != -1 else statement
+def _check_view_nesting(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    for match in _iter_creates(source, "VIEW"):
+        view_name = _last_identifier(_original_text(sql, match, "name"))
+        stmt_start = match.start()
+        stmt_end = _find_next_create(source, stmt_start)
+        body_start = source.upper.find(" AS ", stmt_start, stmt_end)
+        body = sql[body_start + 4 if body_start != -1 else stmt_start : stmt_end]
         body_masked = _mask_comments_and_strings(body)
-        select_count = len(re.findall(r"\bSELECT\b", body_masked, flags=re.IGNORECASE))
+        select_count = len(SELECT_RE.findall(body_masked))
         if select_count > 3:
             _add_issue(
                 issues,
                 "RULE_10_VIEW_NESTING",
                 f"视图 {view_name} 的嵌套层级疑似超过 3 层（检测到 {select_count} 个 SELECT）。",
-                sql,
-                match.start(1),
+                match.start("name"),
                 evidence=view_name,
                 obj_name=view_name,
             )
 
 
-def _check_function_rules(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
-    for match in FUNC_RE.finditer(masked):
-        func_name = _last_identifier(match.group(1))
+def _check_function_rules(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    masked = source.masked_upper
+    for match in _iter_creates(source, "FUNCTION"):
+        func_name = _last_identifier(_original_text(sql, match, "name"))
         stmt_start = match.start()
-        statement = _extract_statement(sql, masked, stmt_start)
-        masked_statement = _mask_comments_and_strings(statement)
-        depth = _max_function_call_depth(masked_statement)
+        stmt_end = _find_next_create(source, stmt_start)
+        # Statements start and end outside comments/literals, so the shared mask applies as is
+        depth = _max_function_call_depth(masked, stmt_start, stmt_end)
         if depth > 3:
             _add_issue(
                 issues,
                 "RULE_11_FUNCTION_NESTING",
                 f"函数 {func_name} 嵌套调用深度 {depth} 超出 3 层限制。",
-                sql,
                 stmt_start,
                 evidence=func_name,
                 obj_name=func_name,
@@ -540,125 +721,150 @@ def _check_function_rules(sql: str, issues: List[Dict]) -> None:
                 issues,
                 "RULE_11_FUNCTION_NESTING_WARN",
                 f"函数 {func_name} 嵌套调用深度 {depth}，建议不超过 2 层。",
-                sql,
                 stmt_start,
                 evidence=func_name,
                 severity="WARNING",
                 obj_name=func_name,
             )
 
-        line_count = statement.count("\n") + 1
+        line_count = _line_span(source.line_starts, stmt_start, stmt_end)
         if line_count > 200:
             _add_issue(
                 issues,
                 "RULE_12_FUNCTION_LENGTH",
                 f"函数 {func_name} 行数为 {line_count}，超过 200 行。",
-                sql,
                 stmt_start,
                 evidence=func_name,
                 obj_name=func_name,
             )
 
 
-def _check_procedure_rules(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
-    for match in PROC_RE.finditer(masked):
-        proc_name = _last_identifier(match.group(1))
+def _check_procedure_rules(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    for match in _iter_creates(source, "PROCEDURE"):
+        proc_name = _last_identifier(_original_text(sql, match, "name"))
         stmt_start = match.start()
-        statement = _extract_statement(sql, masked, stmt_start)
+        stmt_end = _find_next_create(source, stmt_start)
 
-        for eq_match in re.finditer(r"(?<![\s<>=!])=(?!=)", statement):
+        for eq_match in EQ_NO_SPACE_LEFT_RE.finditer(sql, stmt_start, stmt_end):
             _add_issue(
                 issues,
                 "RULE_14_EQUAL_SPACING_LEFT",
                 "存储过程内等号两侧需留空格。",
-                sql,
-                stmt_start + eq_match.start(),
-                evidence=_line_snippet(sql, stmt_start + eq_match.start()),
+                eq_match.start(),
+                evidence=_line_snippet(sql, source.line_starts, eq_match.start()),
                 obj_name=proc_name,
                 severity="WARNING",
             )
 
-        for eq_match in re.finditer(r"=(?!=)(?![\s=])", statement):
+        for eq_match in EQ_NO_SPACE_RIGHT_RE.finditer(sql, stmt_start, stmt_end):
             _add_issue(
                 issues,
                 "RULE_14_EQUAL_SPACING_RIGHT",
                 "存储过程内等号两侧需留空格。",
-                sql,
-                stmt_start + eq_match.start(),
-                evidence=_line_snippet(sql, stmt_start + eq_match.start()),
+                eq_match.start(),
+                evidence=_line_snippet(sql, source.line_starts, eq_match.start()),
                 obj_name=proc_name,
                 severity="WARNING",
             )
 
-        if re.search(r"\bTRUNCATE\b", statement, flags=re.IGNORECASE):
+        if TRUNCATE_RE.search(sql, stmt_start, stmt_end):
             _add_issue(
                 issues,
                 "RULE_20_PROCEDURE_TRUNCATE",
                 f"存储过程 {proc_name} 中禁止使用 TRUNCATE。",
-                sql,
                 stmt_start,
                 evidence=proc_name,
                 obj_name=proc_name,
             )
 
 
-def _check_procedure_comments(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
-    for pattern, label, rule_id in (
-        (PROC_RE, "存储过程", "RULE_05_PROC_COMMENT"),
-        (FUNC_RE, "函数", "RULE_05_FUNC_COMMENT"),
+def _check_procedure_comments(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    masked = source.masked_upper
+    for kind, label, rule_id in (
+        ("PROCEDURE", "存储过程", "RULE_05_PROC_COMMENT"),
+        ("FUNCTION", "函数", "RULE_05_FUNC_COMMENT"),
     ):
-        for match in pattern.finditer(masked):
-            obj_name = _last_identifier(match.group(1))
+        for match in _iter_creates(source, kind):
+            obj_name = _last_identifier(_original_text(sql, match, "name"))
             stmt_start = match.start()
-            statement = _extract_statement(sql, masked, stmt_start)
-            for seg_start, seg_end in _iter_dml_segments(statement):
-                if not _has_adjacent_comment(statement, seg_start, seg_end):
-                    snippet = statement[seg_start:seg_end].strip()
+            stmt_end = _find_next_create(source, stmt_start)
+            for seg_start, seg_end in _iter_dml_segments(masked, stmt_start, stmt_end):
+                if not _has_adjacent_comment(sql, stmt_start, stmt_end, seg_start, seg_end):
+                    # Segments start at the DML keyword, so there is no leading whitespace
+                    snippet = _evidence_slice(sql, seg_start, seg_end)
                     _add_issue(
                         issues,
                         rule_id,
                         f"{label} {obj_name} 包含 DML 语句但缺少注释。",
-                        sql,
-                        stmt_start + seg_start,
+                        seg_start,
                         evidence=snippet,
                         obj_name=obj_name,
                     )
 
 
-def _check_no_trigger(sql: str, issues: List[Dict]) -> None:
-    masked = _mask_comments_and_strings(sql)
-    for match in re.finditer(r"\bCREATE\s+(?:OR\s+REPLACE\s+)?TRIGGER\b", masked, flags=re.IGNORECASE):
+def _check_no_trigger(source: _SqlSource, issues: List[RawIssue]) -> None:
+    sql = source.sql
+    for match in _iter_creates(source, "TRIGGER"):
         _add_issue(
             issues,
             "RULE_13_NO_TRIGGER",
             "不允许创建触发器。",
-            sql,
             match.start(),
-            evidence=_line_snippet(sql, match.start()),
+            evidence=_line_snippet(sql, source.line_starts, match.start()),
         )
 
 
 # ---------- main ----------
+def _dumps_report(payload: Dict) -> str:
+    """Serialise the report with orjson when installed, otherwise with the stdlib encoder."""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(payload, option=_orjson.OPT_INDENT_2 if PRETTY_JSON else 0).decode("utf-8")
+        except _orjson.JSONEncodeError:
+            pass  # lone surrogates are only accepted by the stdlib encoder
+    if PRETTY_JSON:
+        return json.dumps(payload, ensure_ascii=False, indent=2)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
 def main(sql_query: str) -> Dict[str, str]:
     if not isinstance(sql_query, str):
         result = json.dumps({"summary": "输入不是字符串。", "issues": []}, ensure_ascii=False)
         return {"result": result}
 
-    issues: List[Dict] = []
-    sql = sql_query
+    return {"result": _analyse(sql_query)}
+
+
+def _collect_issues(sql: str) -> List[Dict]:
+    """Run every rule check over sql and return the aggregated issue entries."""
+    # Blank input cannot violate any rule; skip building the source views
+    if not sql or sql.isspace():
+        return []
+
+    raw_issues: List[RawIssue] = []
+    source = _build_source(sql)
 
-    _check_cjk(sql, issues)
-    _check_naming_prefixes(sql, issues)
-    _check_table_definitions(sql, issues)
-    _check_delete_full_table(sql, issues)
-    _check_uppercase(sql, issues)
-    _check_view_nesting(sql, issues)
-    _check_function_rules(sql, issues)
-    _check_procedure_rules(sql, issues)
-    _check_procedure_comments(sql, issues)
-    _check_no_trigger(sql, issues)
+    _check_cjk(source, raw_issues)
+    _check_naming_prefixes(source, raw_issues)
+    _check_table_definitions(source, raw_issues)
+    _check_delete_full_table(source, raw_issues)
+    _check_uppercase(source, raw_issues)
+    _check_view_nesting(source, raw_issues)
+    _check_function_rules(source, raw_issues)
+    _check_procedure_rules(source, raw_issues)
+    _check_procedure_comments(source, raw_issues)
+    _check_no_trigger(source, raw_issues)
+    return _aggregate_issues(source, raw_issues)
+
+
+# Callers that keep the module loaded (e.g. a Dify code node) often re-submit the same
+# script; the cached value is the immutable JSON string, never a shared dict.
+@lru_cache(maxsize=32)
+def _analyse(sql: str) -> str:
+    """Run every rule over sql and return the serialised report."""
+    issues = _collect_issues(sql)
 
     file_extension = ".sql"
 
@@ -672,34 +878,14 @@ def main(sql_query: str) -> Dict[str, str]:
             "issues": [],
         }
     else:
-        by_rule: Dict[str, int] = {}
-        total_count = 0
-        for issue in issues:
-            rule_ids = issue.get("rule_ids")
-            if isinstance(rule_ids, list) and rule_ids:
-                for rule in rule_ids:
-                    if not isinstance(rule, str):
-                        continue
-                    key = rule.strip()
-                    if not key:
-                        continue
-                    by_rule[key] = by_rule.get(key, 0) + 1
-            else:
-                rule = issue.get("rule_id")
-                if isinstance(rule, str) and rule.strip():
-                    key = rule.strip()
-                    by_rule[key] = by_rule.get(key, 0) + 1
-
-            entries = issue.get("issues")
-            if isinstance(entries, list) and entries:
-                total_count += len(entries)
-            else:
-                total_count += 1
+        # Every entry is built by _add_issue, so rule_ids/issues are always aligned lists
+        by_rule = Counter(rule for issue in issues for rule in issue["rule_ids"])
+        total_count = sum(len(issue["issues"]) for issue in issues)
 
         payload = {
             "summary": {
                 "total_issues": total_count,
-                "by_rule": by_rule,
+                "by_rule": dict(by_rule),
                 "file_extension": file_extension,
             },
             "issues": issues,
@@ -715,28 +901,35 @@ def main(sql_query: str) -> Dict[str, str]:
         "engine": "sql_rule_engine",
     }
 
-    result = json.dumps(payload, ensure_ascii=False, indent=2)
-    return {"result": result}
+    return _dumps_report(payload)
 
 
 def _read_sql_from_stdin_or_file() -> str:
-    data = sys.stdin.read()
+    # Read raw bytes and decode once; the Node backend always writes UTF-8
+    data = sys.stdin.buffer.read()
     if data:
-        return data
+        return data.decode("utf-8", errors="replace")
 
     if len(sys.argv) > 1:
         sql_file = sys.argv[1]
         if os.path.exists(sql_file):
-            with open(sql_file, "r", encoding="utf-8") as handle:
-                return handle.read()
+            with open(sql_file, "rb") as handle:
+                return handle.read().decode("utf-8", errors="replace")
         raise FileNotFoundError(f"文件 {sql_file} 不存在")
 
     return ""
 
 
 def _emit_json(payload: Dict) -> None:
-    data = json.dumps(payload, ensure_ascii=False)
-    encoded = data.encode("utf-8", errors="surrogateescape")
+    encoded = None
+    if _orjson is not None:
+        try:
+            encoded = _orjson.dumps(payload)
+        except _orjson.JSONEncodeError:
+            encoded = None
+    if encoded is None:
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        encoded = data.encode("utf-8", errors="surrogateescape")
     sys.stdout.buffer.write(encoded)
     sys.stdout.buffer.write(b"\n")
     sys.stdout.buffer.flush()